@@ -11,36 +11,39 @@ Features:
 from __future__ import annotations
 
 import asyncio
+import heapq
+import io
+import json
 import logging
 import os
 import re
 from dataclasses import dataclass
-from datetime import date, datetime, time, timedelta
-from typing import Optional
+from datetime import date, datetime, time, timedelta, timezone
+from functools import partial
+from typing import Awaitable, Callable, Optional
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 import discord
 from dotenv import load_dotenv
 from pathlib import Path
 
-env_path = Path(__file__).parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
 WEEKLY_REPORT_TITLE = "\U0001F4CA Weekly Report"
 MONTHLY_REPORT_TITLE = "\U0001F4C8 Monthly Report"
-
-logging.basicConfig(
-    level=os.getenv("LOG_LEVEL", "INFO").upper(),
-    format="%(asctime)s [%(levelname)s] %(message)s",
+DAILY_REMINDER_MESSAGE = (
+    "@everyone\n"
+    "⏰ Daily Update Reminder\n\n"
+    "If you didn’t write your update yet, please send it now."
 )
+
 logger = logging.getLogger("discord_automation_bot")
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BotConfig:
     bot_token: str
     channel_id: int
     user_ids: list[int]
+    user_id_set: frozenset[int]
     timezone_name: str
     timezone: ZoneInfo
     daily_reminder_time: time
@@ -52,6 +55,18 @@ class BotConfig:
     manual_reminder_command: str
     update_message_pattern: str
     one_update_per_day: bool
+    state_path: Path
+
+
+def load_environment():
+    # Done at startup rather than import time so importing this module has no side effects.
+    env_path = Path(__file__).parent / ".env"
+    load_dotenv(dotenv_path=env_path)
+
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s [%(levelname)s] %(message)s",
+    )
 
 
 def parse_time(value: str, var_name: str) -> time:
@@ -125,6 +140,7 @@ def load_config() -> BotConfig:
         r"\b(daily\W*updates?|updates?)\b",
     ).strip()
     one_update_per_day = parse_bool(os.getenv("ONE_UPDATE_PER_DAY", "false"))
+    state_path_raw = os.getenv("STATE_PATH", "").strip()
 
     if not token:
         raise ValueError("BOT_TOKEN is required.")
@@ -153,6 +169,7 @@ def load_config() -> BotConfig:
         bot_token=token,
         channel_id=channel_id,
         user_ids=user_ids,
+        user_id_set=frozenset(user_ids),
         timezone_name=timezone_name,
         timezone=timezone_obj,
         daily_reminder_time=parse_time(daily_time_raw, "DAILY_REMINDER_TIME"),
@@ -164,19 +181,67 @@ def load_config() -> BotConfig:
         manual_reminder_command=manual_reminder_command,
         update_message_pattern=update_message_pattern,
         one_update_per_day=one_update_per_day,
+        state_path=Path(state_path_raw) if state_path_raw else Path(__file__).parent / "state.json",
     )
 
 
-def format_daily_reminder() -> str:
-    return (
-        "@everyone\n"
-        "⏰ Daily Update Reminder\n\n"
-        "If you didn’t write your update yet, please send it now."
+LITERAL_ALTERNATION_RE = re.compile(r"\\b\((?:\?:)?([^()]*)\)\\b")
+REGEX_METACHARACTERS = frozenset("\\.^$*+?{}[]()|")
+
+
+def parse_literal_alternation(pattern: str) -> Optional[tuple[str, ...]]:
+    match = LITERAL_ALTERNATION_RE.fullmatch(pattern)
+    if match is None:
+        return None
+
+    literals = match.group(1).split("|")
+    if any(
+        not literal or not literal.isascii() or REGEX_METACHARACTERS.intersection(literal)
+        for literal in literals
+    ):
+        return None
+    return tuple(dict.fromkeys(literal.lower() for literal in literals))
+
+
+def is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+def is_word_boundary(text: str, index: int) -> bool:
+    before = index > 0 and is_word_char(text[index - 1])
+    after = index < len(text) and is_word_char(text[index])
+    return before != after
+
+
+def contains_bounded_literal(text: str, literals: tuple[str, ...]) -> bool:
+    for literal in literals:
+        start = text.find(literal)
+        while start != -1:
+            if is_word_boundary(text, start) and is_word_boundary(text, start + len(literal)):
+                return True
+            start = text.find(literal, start + 1)
+    return False
+
+
+def state_fingerprint(config: BotConfig) -> str:
+    # Anything that changes which messages are counted, or on which day, invalidates the tally.
+    commands = sorted(
+        cmd.strip().lower()
+        for cmd in (config.weekly_report_command, config.monthly_report_command, config.manual_reminder_command)
+    )
+    return json.dumps(
+        [config.channel_id, sorted(config.user_ids), config.timezone_name, config.update_message_pattern, commands]
     )
 
 
-def seconds_until_next_run(target_time: time, timezone_obj: ZoneInfo, weekday: Optional[int] = None) -> float:
-    now = datetime.now(timezone_obj)
+def seconds_until_next_run(
+    target_time: time,
+    timezone_obj: ZoneInfo,
+    weekday: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> float:
+    if now is None:
+        now = datetime.now(timezone_obj)
 
     if weekday is None:
         candidate = datetime.combine(now.date(), target_time, tzinfo=timezone_obj)
@@ -192,6 +257,18 @@ def seconds_until_next_run(target_time: time, timezone_obj: ZoneInfo, weekday: O
     return max((candidate - now).total_seconds(), 1.0)
 
 
+def seconds_until_next_month(target_time: time, timezone_obj: ZoneInfo, now: Optional[datetime] = None) -> float:
+    if now is None:
+        now = datetime.now(timezone_obj)
+
+    if now.month == 12:
+        first_of_next_month = date(now.year + 1, 1, 1)
+    else:
+        first_of_next_month = date(now.year, now.month + 1, 1)
+    candidate = datetime.combine(first_of_next_month, target_time, tzinfo=timezone_obj)
+    return max((candidate - now).total_seconds(), 1.0)
+
+
 def build_ascii_table(headers: list[str], rows: list[list[str]]) -> str:
     str_rows = [[str(cell) for cell in row] for row in rows]
     widths = [len(h) for h in headers]
@@ -199,17 +276,17 @@ def build_ascii_table(headers: list[str], rows: list[list[str]]) -> str:
         for i, cell in enumerate(row):
             widths[i] = max(widths[i], len(cell))
 
-    def hr() -> str:
-        return "+-" + "-+-".join("-" * w for w in widths) + "-+"
+    hr = "+-" + "-+-".join("-" * w for w in widths) + "-+"
+    row_fmt = "| " + " | ".join(f"{{:<{w}}}" for w in widths) + " |\n"
 
-    def render_row(cells: list[str]) -> str:
-        padded = [cells[i].ljust(widths[i]) for i in range(len(widths))]
-        return "| " + " | ".join(padded) + " |"
-
-    lines = [hr(), render_row(headers), hr()]
-    lines.extend(render_row(row) for row in str_rows)
-    lines.append(hr())
-    return "\n".join(lines)
+    buf = io.StringIO()
+    buf.write(hr + "\n")
+    buf.write(row_fmt.format(*headers))
+    buf.write(hr + "\n")
+    for row in str_rows:
+        buf.write(row_fmt.format(*row))
+    buf.write(hr)
+    return buf.getvalue()
 
 
 def build_period_report(
@@ -224,25 +301,15 @@ def build_period_report(
     total_updates = sum(counts.values())
 
     headers = ["User", "Updates"]
-    rows: list[list[str]] = []
-    for user_id in user_ids:
-        row = [
-            user_labels.get(user_id, str(user_id)),
-            str(counts[user_id]),
-        ]
-        rows.append(row)
-
+    rows = [[user_labels.get(user_id, str(user_id)), str(counts[user_id])] for user_id in user_ids]
     table = build_ascii_table(headers, rows)
 
-    lines = [
-        title,
-        f"Period: {period_start.isoformat()} to {period_end.isoformat()} ({period_label})",
-        f"Total Updates: {total_updates}",
-        "```text",
-        table,
-        "```",
-    ]
-    return "\n".join(lines)
+    return (
+        f"{title}\n"
+        f"Period: {period_start.isoformat()} to {period_end.isoformat()} ({period_label})\n"
+        f"Total Updates: {total_updates}\n"
+        f"```text\n{table}\n```"
+    )
 
 
 class DiscordAutomationBot(discord.Client):
@@ -250,15 +317,53 @@ class DiscordAutomationBot(discord.Client):
         super().__init__(**kwargs)
         self.config = config
         self.tasks_started = False
+        self._schedule: list[tuple[float, str, Callable[[], Awaitable[None]]]] = []
+        self._cached_channel: Optional[discord.abc.Messageable] = None
+        self._state_path = config.state_path
+        self._state_lock = asyncio.Lock()
+        self._last_seen_id: Optional[int] = None
+        self._covered_from: Optional[date] = None
+        self._daily_tally: dict[date, dict[int, int]] = {}
+        self.load_state()
         self.manual_weekly_command = config.weekly_report_command.strip().lower()
         self.manual_monthly_command = config.monthly_report_command.strip().lower()
         self.manual_reminder_command = config.manual_reminder_command.strip().lower()
         self.update_message_regex = re.compile(config.update_message_pattern, re.IGNORECASE)
+        # Plain word-bounded alternations are matched with str.find instead of the regex engine.
+        self.update_message_literals = parse_literal_alternation(config.update_message_pattern)
+        self._command_set = frozenset(
+            {self.manual_weekly_command, self.manual_monthly_command, self.manual_reminder_command}
+        )
+        # First characters a command message can start with; anything else cannot be a command.
+        self._command_prefixes = frozenset(ch for cmd in self._command_set for ch in (cmd[0], cmd[0].upper()))
+        # Listed lowest priority first: if two commands normalize to the same string, the later
+        # entry wins, so weekly beats monthly beats reminder as the original if-chain did.
+        self._command_dispatch: dict[str, Callable[[], Awaitable[None]]] = {
+            self.manual_reminder_command: self.send_daily_reminder,
+            self.manual_monthly_command: partial(self.send_monthly_report, reason="manual"),
+            self.manual_weekly_command: partial(self.send_weekly_report, reason="manual"),
+        }
+
+    def normalize_command(self, content: str) -> Optional[str]:
+        first = content[:1]
+        # Only ASCII is safe to reject early: lower() of other characters can change them entirely
+        # (e.g. "İ" -> "i̇", Kelvin sign -> "k").
+        if first.isascii() and first not in self._command_prefixes and not first.isspace():
+            return None
+        normalized = content.strip().lower()
+        return normalized if normalized in self._command_set else None
 
     def is_update_message(self, content: str) -> bool:
+        # str.lower() can change length or add combining marks outside ASCII (e.g. "İ"), which would
+        # shift the word boundaries the regex sees, so only ASCII text takes the literal fast path.
+        if self.update_message_literals is not None and content.isascii():
+            return contains_bounded_literal(content.lower(), self.update_message_literals)
         return bool(self.update_message_regex.search(content))
 
     async def get_target_channel(self) -> Optional[discord.abc.Messageable]:
+        if self._cached_channel is not None:
+            return self._cached_channel
+
         channel = self.get_channel(self.config.channel_id)
 
         if channel is None:
@@ -268,17 +373,31 @@ class DiscordAutomationBot(discord.Client):
                 logger.error("Failed to fetch channel: %s", exc)
                 return None
 
+        self._cached_channel = channel
         return channel
 
+    async def send_to_channel(self, channel, content: str, **kwargs) -> bool:
+        try:
+            await channel.send(content, **kwargs)
+        except (discord.NotFound, discord.Forbidden) as exc:
+            # Drop the cached channel so the next send re-resolves it.
+            self._cached_channel = None
+            logger.error("Failed to send message to channel: %s", exc)
+            return False
+        return True
+
     async def send_daily_reminder(self):
         channel = await self.get_target_channel()
         if channel is None:
             return
 
-        await channel.send(
-            format_daily_reminder(),
+        sent = await self.send_to_channel(
+            channel,
+            DAILY_REMINDER_MESSAGE,
             allowed_mentions=discord.AllowedMentions(everyone=True),
         )
+        if not sent:
+            return
         logger.info("Daily reminder sent.")
 
     def weekly_period(self, now: datetime, reason: str) -> tuple[date, date]:
@@ -302,42 +421,138 @@ class DiscordAutomationBot(discord.Client):
         label = "Previous calendar month"
         return start_date, end_date, label
 
-    async def collect_counts_for_period(self, channel, start_date: date, end_date: date):
-        start_time = datetime.combine(start_date, time.min, tzinfo=self.config.timezone)
-        end_time = datetime.combine(end_date, time.max, tzinfo=self.config.timezone)
+    def load_state(self):
+        try:
+            raw = json.loads(self._state_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            logger.warning("Ignoring unreadable state file %s: %s", self._state_path, exc)
+            return
 
-        counts = {uid: 0 for uid in self.config.user_ids}
-        seen_daily = set()
+        if not isinstance(raw, dict):
+            logger.warning("Ignoring malformed state file %s: expected a JSON object", self._state_path)
+            return
 
-        async for message in channel.history(limit=None, after=start_time - timedelta(seconds=1), before=end_time + timedelta(seconds=1)):
-            if message.author.bot:
-                continue
+        if raw.get("fingerprint") != state_fingerprint(self.config):
+            logger.info("Configuration changed since state was saved; history will be rescanned.")
+            return
 
-            normalized_content = message.content.strip().lower()
-            if normalized_content == self.manual_weekly_command:
-                continue
-            if normalized_content == self.manual_monthly_command:
-                continue
-            if normalized_content == self.manual_reminder_command:
-                continue
-            if not self.is_update_message(message.content):
-                continue
+        try:
+            last_seen_id = raw["last_seen_id"]
+            last_seen_id = int(last_seen_id) if last_seen_id is not None else None
+            covered_from = date.fromisoformat(raw["covered_from"])
+            daily_tally = {
+                date.fromisoformat(day): {int(uid): int(n) for uid, n in day_counts.items()}
+                for day, day_counts in raw["daily_tally"].items()
+            }
+        except (AttributeError, KeyError, TypeError, ValueError) as exc:
+            logger.warning("Ignoring malformed state file %s: %s", self._state_path, exc)
+            return
 
-            uid = message.author.id
-            if uid not in counts:
-                continue
+        self._last_seen_id = last_seen_id
+        self._covered_from = covered_from
+        self._daily_tally = daily_tally
+
+    def save_state(self):
+        payload = {
+            "fingerprint": state_fingerprint(self.config),
+            "last_seen_id": self._last_seen_id,
+            "covered_from": self._covered_from.isoformat() if self._covered_from else None,
+            "daily_tally": {
+                day.isoformat(): {str(uid): n for uid, n in day_counts.items()}
+                for day, day_counts in sorted(self._daily_tally.items())
+            },
+        }
+        tmp_path = self._state_path.with_name(self._state_path.name + ".tmp")
+        try:
+            tmp_path.write_text(json.dumps(payload), encoding="utf-8")
+            tmp_path.replace(self._state_path)
+        except OSError as exc:
+            logger.error("Failed to save state to %s: %s", self._state_path, exc)
+
+    async def sync_daily_tally(self, channel, start_date: date):
+        timezone_obj = self.config.timezone
+        today = datetime.now(timezone_obj).date()
+        # Keep enough days for the scheduled monthly report (the whole previous calendar month).
+        retention_start = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+        keep_from = min(start_date, retention_start)
+
+        if self._covered_from is None or start_date < self._covered_from:
+            self._daily_tally = {}
+            self._covered_from = keep_from
+            self._last_seen_id = None
+        elif self._covered_from < keep_from:
+            for day in [day for day in self._daily_tally if day < keep_from]:
+                del self._daily_tally[day]
+            self._covered_from = keep_from
+        covered_from = self._covered_from
+
+        # `after` is exclusive, so step back one second to keep messages sent exactly at midnight.
+        window_floor = datetime.combine(covered_from, time.min, tzinfo=timezone_obj) - timedelta(seconds=1)
+        if self._last_seen_id is None:
+            after = window_floor
+        else:
+            # A long-idle state file may point far before the retained window; skip that history.
+            floor_id = discord.utils.time_snowflake(window_floor, high=True)
+            after = discord.Object(id=max(self._last_seen_id, floor_id))
+
+        daily_tally = self._daily_tally
+        user_id_set = self.config.user_id_set
+        normalize_command = self.normalize_command
+        is_update_message = self.is_update_message
+        last_seen_id = self._last_seen_id
+        # UTC bounds of the local day of the last converted message. History is oldest-first, so
+        # most messages fall in the same local day and skip the ZoneInfo conversion entirely.
+        local_day = covered_from
+        day_start_utc = day_end_utc = datetime.min.replace(tzinfo=timezone.utc)
+
+        try:
+            async for message in channel.history(limit=None, after=after, oldest_first=True):
+                last_seen_id = message.id
+
+                # Cheapest checks first: most traffic is from untracked users.
+                author = message.author
+                if author.bot:
+                    continue
+                uid = author.id
+                if uid not in user_id_set:
+                    continue
 
-            local_day = message.created_at.astimezone(self.config.timezone).date()
-            if local_day < start_date or local_day > end_date:
-                continue
+                content = message.content
+                if normalize_command(content) is not None:
+                    continue
+                if not is_update_message(content):
+                    continue
 
-            if self.config.one_update_per_day:
-                key = (uid, local_day)
-                if key in seen_daily:
+                created_at = message.created_at
+                if not (day_start_utc <= created_at < day_end_utc):
+                    local_day = created_at.astimezone(timezone_obj).date()
+                    day_start_utc = datetime.combine(local_day, time.min, tzinfo=timezone_obj).astimezone(timezone.utc)
+                    day_end_utc = datetime.combine(
+                        local_day + timedelta(days=1), time.min, tzinfo=timezone_obj
+                    ).astimezone(timezone.utc)
+                if local_day < covered_from:
                     continue
-                seen_daily.add(key)
 
-            counts[uid] += 1
+                day_counts = daily_tally.setdefault(local_day, {})
+                day_counts[uid] = day_counts.get(uid, 0) + 1
+        finally:
+            # Record progress even if pagination fails part-way, so counted messages are not re-counted.
+            self._last_seen_id = last_seen_id
+            self.save_state()
+
+    async def collect_counts_for_period(self, channel, start_date: date, end_date: date):
+        async with self._state_lock:
+            await self.sync_daily_tally(channel, start_date)
+
+        counts = {uid: 0 for uid in self.config.user_ids}
+        one_update_per_day = self.config.one_update_per_day
+        for local_day, day_counts in self._daily_tally.items():
+            if local_day < start_date or local_day > end_date:
+                continue
+            for uid, n in day_counts.items():
+                counts[uid] += 1 if one_update_per_day else n
         return counts
 
     async def resolve_user_labels(self, channel) -> dict[int, str]:
@@ -391,7 +606,9 @@ class DiscordAutomationBot(discord.Client):
             "Last 7 days (current day + previous 6 days)",
         )
 
-        await channel.send(report, allowed_mentions=discord.AllowedMentions.none())
+        sent = await self.send_to_channel(channel, report, allowed_mentions=discord.AllowedMentions.none())
+        if not sent:
+            return
         logger.info("Weekly report (%s) sent for %s to %s.", reason, start_date, end_date)
 
     async def send_monthly_report(self, reason="scheduled"):
@@ -414,36 +631,36 @@ class DiscordAutomationBot(discord.Client):
             label,
         )
 
-        await channel.send(report, allowed_mentions=discord.AllowedMentions.none())
+        sent = await self.send_to_channel(channel, report, allowed_mentions=discord.AllowedMentions.none())
+        if not sent:
+            return
         logger.info("Monthly report (%s) sent for %s to %s.", reason, start_date, end_date)
 
-    async def daily_scheduler(self):
-        while not self.is_closed():
-            wait_seconds = seconds_until_next_run(
-                self.config.daily_reminder_time,
-                self.config.timezone,
-            )
-            await asyncio.sleep(wait_seconds)
-            await self.send_daily_reminder()
-
-    async def weekly_scheduler(self):
-        while not self.is_closed():
-            wait_seconds = seconds_until_next_run(
+    def seconds_until_job(self, name: str, now: datetime) -> float:
+        if name == "daily":
+            return seconds_until_next_run(self.config.daily_reminder_time, self.config.timezone, now=now)
+        if name == "weekly":
+            return seconds_until_next_run(
                 self.config.weekly_report_time,
                 self.config.timezone,
                 weekday=self.config.weekly_report_weekday,
+                now=now,
             )
-            await asyncio.sleep(wait_seconds)
-            await self.send_weekly_report()
+        return seconds_until_next_month(self.config.monthly_report_time, self.config.timezone, now=now)
+
+    async def scheduler_loop(self):
+        # One task drives every scheduled job from a min-heap of (loop time, name, handler).
+        loop = asyncio.get_running_loop()
+        while not self.is_closed() and self._schedule:
+            fire_at, name, handler = heapq.heappop(self._schedule)
+            await asyncio.sleep(max(fire_at - loop.time(), 0.0))
+            try:
+                await handler()
+            except Exception:
+                logger.exception("Scheduled %s job failed.", name)
 
-    async def monthly_scheduler(self):
-        while not self.is_closed():
             now = datetime.now(self.config.timezone)
-            first_of_next_month = (now.replace(day=28) + timedelta(days=4)).replace(day=1)
-            candidate = datetime.combine(first_of_next_month.date(), self.config.monthly_report_time, tzinfo=self.config.timezone)
-            wait_seconds = max((candidate - now).total_seconds(), 1.0)
-            await asyncio.sleep(wait_seconds)
-            await self.send_monthly_report()
+            heapq.heappush(self._schedule, (loop.time() + self.seconds_until_job(name, now), name, handler))
 
     async def on_ready(self):
         logger.info("Logged in as %s", self.user)
@@ -452,10 +669,17 @@ class DiscordAutomationBot(discord.Client):
             return
 
         self.tasks_started = True
-        asyncio.create_task(self.daily_scheduler())
-        asyncio.create_task(self.weekly_scheduler())
-        asyncio.create_task(self.monthly_scheduler())
-        logger.info("Schedulers started.")
+        now = datetime.now(self.config.timezone)
+        loop_now = asyncio.get_running_loop().time()
+        jobs = (
+            ("daily", self.send_daily_reminder),
+            ("weekly", self.send_weekly_report),
+            ("monthly", self.send_monthly_report),
+        )
+        self._schedule = [(loop_now + self.seconds_until_job(name, now), name, handler) for name, handler in jobs]
+        heapq.heapify(self._schedule)
+        asyncio.create_task(self.scheduler_loop())
+        logger.info("Scheduler started.")
 
     async def on_message(self, message: discord.Message):
         if message.author.bot:
@@ -464,18 +688,13 @@ class DiscordAutomationBot(discord.Client):
         if message.channel.id != self.config.channel_id:
             return
 
-        normalized_content = message.content.strip().lower()
-        if normalized_content == self.manual_weekly_command:
-            await self.send_weekly_report(reason="manual")
-            return
-        if normalized_content == self.manual_monthly_command:
-            await self.send_monthly_report(reason="manual")
-            return
-        if normalized_content == self.manual_reminder_command:
-            await self.send_daily_reminder()
+        command = self.normalize_command(message.content)
+        if command is not None:
+            await self._command_dispatch[command]()
 
 
 def main():
+    load_environment()
     config = load_config()
 
     intents = discord.Intents.default()
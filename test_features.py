@@ -7,6 +7,7 @@ This script:
 - Tests daily reminder output
 - Tests weekly report (scheduled + manual)
 - Tests monthly report (scheduled + manual)
+- Checks the saved tally: resume after restart, pruning, and config invalidation
 - Prints all generated messages so you can review report tables
 
 Run:
@@ -16,64 +17,125 @@ Run:
 from __future__ import annotations
 
 import asyncio
+import json
 import sys
-from dataclasses import dataclass
+import tempfile
+from bisect import bisect_left, bisect_right
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
 from datetime import date, datetime, time, timedelta
-from typing import Optional
+from functools import lru_cache
+from operator import attrgetter, itemgetter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Awaitable, Optional
 
 import discord
 
-from main import DiscordAutomationBot, load_config
+from main import (
+    MONTHLY_REPORT_TITLE,
+    WEEKLY_REPORT_TITLE,
+    DiscordAutomationBot,
+    load_config,
+    load_environment,
+    state_fingerprint,
+)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FakeAuthor:
     id: int
     bot: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class FakeMessage:
     author: FakeAuthor
     content: str
     created_at: datetime
+    id: int = 0
+
+
+def as_snowflake(value, high: bool) -> int:
+    # discord.py accepts either a datetime or a snowflake-like object for `after`/`before`.
+    if isinstance(value, datetime):
+        return discord.utils.time_snowflake(value, high=high)
+    return value.id
+
+
+# Index of the report task currently running, so concurrently sent messages can be put back in order.
+report_index: ContextVar[int] = ContextVar("report_index", default=0)
+
+
+class FakeHistoryIterator:
+    # Async iterator over an already-built list, so `async for` needs no generator frame per item.
+    def __init__(self, items: list[FakeMessage]) -> None:
+        self._it = iter(items)
+
+    def __aiter__(self) -> "FakeHistoryIterator":
+        return self
+
+    async def __anext__(self) -> FakeMessage:
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+
+def assign_snowflakes(messages: list[FakeMessage]) -> None:
+    # Give messages increasing snowflake IDs in creation order, as Discord does.
+    for seq, msg in enumerate(sorted(messages, key=attrgetter("created_at"))):
+        msg.id = discord.utils.time_snowflake(msg.created_at) + seq
 
 
 class FakeChannel:
     def __init__(self, messages: list[FakeMessage]) -> None:
-        self._messages = messages
-        self.sent_messages: list[str] = []
-
-    async def history(
+        self.sent_messages: list[tuple[int, str]] = []
+        # (after, number of messages returned) for every history() call.
+        self.history_calls: list[tuple[object, int]] = []
+        # Sort once: history() is called for every report and the message list never changes.
+        self._messages_asc = sorted(messages, key=attrgetter("id"))
+        self._ids_asc = [msg.id for msg in self._messages_asc]
+
+    def history(
         self,
         limit: Optional[int] = None,
-        after: Optional[datetime] = None,
-        before: Optional[datetime] = None,
-    ):
-        yielded = 0
-        for msg in sorted(self._messages, key=lambda m: m.created_at, reverse=True):
-            if after is not None and not (msg.created_at > after):
-                continue
-            if before is not None and not (msg.created_at < before):
-                continue
-            yield msg
-            yielded += 1
-            if limit is not None and yielded >= limit:
-                return
+        after=None,
+        before=None,
+        oldest_first: Optional[bool] = None,
+    ) -> FakeHistoryIterator:
+        # Mirror discord.py: passing `after` defaults to oldest-first ordering.
+        if oldest_first is None:
+            oldest_first = after is not None
+        # IDs are ascending, so the (after, before) window is one contiguous slice.
+        lo = bisect_right(self._ids_asc, as_snowflake(after, high=True)) if after is not None else 0
+        hi = bisect_left(self._ids_asc, as_snowflake(before, high=False)) if before is not None else len(self._ids_asc)
+        window = self._messages_asc[lo:hi]
+        if not oldest_first:
+            window.reverse()
+        window = window[:limit]
+        self.history_calls.append((after, len(window)))
+        return FakeHistoryIterator(window)
 
     async def send(self, content: str, **kwargs) -> None:
-        self.sent_messages.append(content)
+        self.sent_messages.append((report_index.get(), content))
 
 
+SAMPLE_MESSAGE_TIME = time(10, 0)
+
+
+@lru_cache(maxsize=512)
 def make_local_dt(tz, y: int, m: int, d: int, hh: int, mm: int = 0) -> datetime:
     return datetime(y, m, d, hh, mm, tzinfo=tz)
 
 
+@lru_cache(maxsize=512)
 def week_window(now: datetime, manual: bool) -> tuple[date, date]:
     today = now.date()
     return today - timedelta(days=6), today
 
 
+@lru_cache(maxsize=512)
 def month_window(now: datetime, manual: bool) -> tuple[date, date]:
     today = now.date()
     if manual:
@@ -88,34 +150,58 @@ def sample_messages(config, now: datetime) -> list[FakeMessage]:
     tz = config.timezone
     update_keyword = "daily update"
     non_update_text = "random message"
+    weekly_command = config.weekly_report_command
+    monthly_command = config.monthly_report_command
+    reminder_command = config.manual_reminder_command
     messages: list[FakeMessage] = []
+    # One shared author object per user instead of one per message.
+    authors = {uid: FakeAuthor(uid, bot=False) for uid in users}
+    append = messages.append
 
     def add(uid: int, dt: datetime, content: str) -> None:
-        messages.append(FakeMessage(author=FakeAuthor(uid, bot=False), content=content, created_at=dt))
+        append(FakeMessage(authors[uid], content, dt))
 
     # Include manual command messages (must be ignored by counters)
-    add(users[0], make_local_dt(tz, now.year, now.month, max(now.day - 1, 1), 9), config.weekly_report_command)
-    add(users[1], make_local_dt(tz, now.year, now.month, max(now.day - 1, 1), 10), config.monthly_report_command)
-    add(users[2], make_local_dt(tz, now.year, now.month, max(now.day - 1, 1), 11), config.manual_reminder_command)
-
-    # Build messages across last 45 days to cover weekly + monthly windows.
-    for offset in range(0, 45):
-        day = now.date() - timedelta(days=offset)
-        base_dt = datetime.combine(day, time(10, 0), tzinfo=tz)
-        # user 0: consistent updater, sometimes duplicate updates same day
+    yesterday = max(now.day - 1, 1)
+    add(users[0], make_local_dt(tz, now.year, now.month, yesterday, 9), weekly_command)
+    add(users[1], make_local_dt(tz, now.year, now.month, yesterday, 10), monthly_command)
+    add(users[2], make_local_dt(tz, now.year, now.month, yesterday, 11), reminder_command)
+
+    # Build messages back to the earliest report window start, plus one day before it so the
+    # window edge is exercised. One base timestamp per day, then each user's pattern is a
+    # stride over those days.
+    earliest = min(
+        month_window(now, manual=False)[0],
+        week_window(now, manual=False)[0],
+        week_window(now, manual=True)[0],
+    )
+    days = (now.date() - earliest).days + 2
+    # Aware-datetime arithmetic within one zone is wall-clock arithmetic, so stepping back whole
+    # days from one base keeps every sample at 10:00 local time, even across DST changes.
+    base0 = datetime.combine(now.date(), SAMPLE_MESSAGE_TIME, tzinfo=tz)
+    one_day = timedelta(days=1)
+    half_hour = timedelta(minutes=30)
+    one_hour = timedelta(hours=1)
+    two_hours = timedelta(hours=2)
+    three_hours = timedelta(hours=3)
+    day_bases = [base0 - offset * one_day for offset in range(0, days)]
+
+    # user 0: consistent updater, sometimes duplicate updates same day
+    for base_dt in day_bases:
         add(users[0], base_dt, update_keyword)
-        add(users[0], base_dt + timedelta(hours=1), update_keyword)
+        add(users[0], base_dt + one_hour, update_keyword)
 
-        # user 1: updates every 2 days
-        if offset % 2 == 0:
-            add(users[1], base_dt + timedelta(minutes=30), "updates done")
+    # user 1: updates every 2 days
+    for base_dt in day_bases[::2]:
+        add(users[1], base_dt + half_hour, "updates done")
 
-        # user 2: sparse
-        if offset % 5 == 0:
-            add(users[2], base_dt + timedelta(hours=2), "Daily Updates posted")
+    # user 2: sparse
+    for base_dt in day_bases[::5]:
+        add(users[2], base_dt + two_hours, "Daily Updates posted")
 
-        # user 3: non-update text (should be ignored)
-        add(users[3], base_dt + timedelta(hours=3), non_update_text)
+    # user 3: non-update text (should be ignored)
+    for base_dt in day_bases:
+        add(users[3], base_dt + three_hours, non_update_text)
 
     # Add a bot message that matches keyword (should be ignored)
     messages.append(
@@ -125,22 +211,19 @@ def sample_messages(config, now: datetime) -> list[FakeMessage]:
             created_at=make_local_dt(tz, now.year, now.month, max(now.day - 2, 1), 13),
         )
     )
+    assign_snowflakes(messages)
     return messages
 
 
-async def run() -> None:
-    # Make emoji/table output safe in Windows terminals using cp1252.
-    try:
-        sys.stdout.reconfigure(encoding="utf-8")
-    except Exception:
-        pass
-
-    config = load_config()
+async def run_reports(config) -> None:
     intents = discord.Intents.none()
     bot = DiscordAutomationBot(config=config, intents=intents)
 
     now = datetime.now(config.timezone)
-    fake_channel = FakeChannel(sample_messages(config, now))
+    # Everything downstream is day-granular; a coarse `now` keeps the memoized windows hitting.
+    now = now.replace(minute=(now.minute // 10) * 10, second=0, microsecond=0)
+    messages = sample_messages(config, now)
+    fake_channel = FakeChannel(messages)
 
     async def fake_get_target_channel():
         return fake_channel
@@ -165,16 +248,217 @@ async def run() -> None:
     print(f"Monthly manual:   {m_m_start} -> {m_m_end}")
     print()
 
-    await bot.send_daily_reminder()
-    await bot.send_weekly_report(reason="scheduled")
-    await bot.send_weekly_report(reason="manual")
-    await bot.send_monthly_report(reason="scheduled")
-    await bot.send_monthly_report(reason="manual")
+    async def run_indexed(index: int, report: Awaitable[None]) -> None:
+        # Each task runs in its own context copy, so this only tags messages sent by this report.
+        report_index.set(index)
+        await report
+
+    reports = [
+        bot.send_daily_reminder(),
+        bot.send_weekly_report(reason="scheduled"),
+        bot.send_weekly_report(reason="manual"),
+        bot.send_monthly_report(reason="scheduled"),
+        bot.send_monthly_report(reason="manual"),
+    ]
+    await asyncio.gather(*(asyncio.create_task(run_indexed(i, report)) for i, report in enumerate(reports)))
+    sent_messages = [payload for _, payload in sorted(fake_channel.sent_messages, key=itemgetter(0))]
 
     print("=== GENERATED OUTPUTS ===")
-    for i, payload in enumerate(fake_channel.sent_messages, start=1):
-        print(f"\n--- Message {i} ---")
-        print(payload)
+    sys.stdout.write(
+        "".join(
+            f"\n--- Message {i} ---\n{payload}\n"
+            for i, payload in enumerate(sent_messages, start=1)
+        )
+    )
+    print()
+
+    await check_persisted_state(config, now, messages)
+
+
+async def check_persisted_state(config, now: datetime, messages: list[FakeMessage]) -> None:
+    intents = discord.Intents.none()
+    tz = config.timezone
+    start_date, end_date = month_window(now, manual=False)[0], now.date()
+
+    async def rescan(channel: FakeChannel) -> dict[int, int]:
+        with tempfile.TemporaryDirectory() as fresh_dir:
+            fresh = DiscordAutomationBot(
+                config=replace(config, state_path=Path(fresh_dir) / "state.json"),
+                intents=intents,
+            )
+            return await fresh.collect_counts_for_period(channel, start_date, end_date)
+
+    print("=== STATE CHECKS ===")
+
+    # Restart on the saved state, then pick up a message posted after the last seen one.
+    late_update_at = datetime.combine(now.date(), time(23, 0), tzinfo=tz)
+    late_update = FakeMessage(
+        FakeAuthor(config.user_ids[3]),
+        "daily update",
+        late_update_at,
+        id=discord.utils.time_snowflake(late_update_at),
+    )
+    channel = FakeChannel([*messages, late_update])
+    resumed = DiscordAutomationBot(config=config, intents=intents)
+    resumed_counts = await resumed.collect_counts_for_period(channel, start_date, end_date)
+    after, scanned = channel.history_calls[-1]
+    assert not isinstance(after, datetime) and scanned == 1, f"resume read {scanned} messages after {after!r}"
+    fresh_counts = await rescan(channel)
+    assert resumed_counts == fresh_counts, f"resumed {resumed_counts} != rescanned {fresh_counts}"
+    assert resumed_counts[config.user_ids[3]] == 1, "new message was not counted"
+    print("Resume from last seen message matches a full rescan: OK")
+
+    # A long-idle state file: stale days are pruned and history before the window is not re-read.
+    stale_day = start_date - timedelta(days=40)
+    oldest_id = min(msg.id for msg in messages)
+    with tempfile.TemporaryDirectory() as stale_dir:
+        stale_path = Path(stale_dir) / "state.json"
+        stale_path.write_text(
+            json.dumps(
+                {
+                    "fingerprint": state_fingerprint(config),
+                    "last_seen_id": oldest_id,
+                    "covered_from": stale_day.isoformat(),
+                    "daily_tally": {stale_day.isoformat(): {str(config.user_ids[0]): 1}},
+                }
+            ),
+            encoding="utf-8",
+        )
+        channel = FakeChannel(messages)
+        pruned = DiscordAutomationBot(config=replace(config, state_path=stale_path), intents=intents)
+        pruned_counts = await pruned.collect_counts_for_period(channel, start_date, end_date)
+        saved = json.loads(stale_path.read_text(encoding="utf-8"))
+
+    window_start = datetime.combine(start_date, time.min, tzinfo=tz)
+    in_window = sum(1 for msg in messages if msg.created_at >= window_start)
+    _, scanned = channel.history_calls[-1]
+    assert stale_day.isoformat() not in saved["daily_tally"], "stale day was not pruned"
+    assert saved["covered_from"] == start_date.isoformat(), f"coverage starts at {saved['covered_from']}"
+    assert scanned == in_window, f"read {scanned} messages, expected only the {in_window} in the window"
+    assert pruned_counts == await rescan(channel), "pruned state disagrees with a full rescan"
+    print("Days before the previous calendar month are pruned: OK")
+
+    # A state file written under a different configuration is discarded.
+    channel = FakeChannel(messages)
+    changed = DiscordAutomationBot(
+        config=replace(config, update_message_pattern=r"\bdone\b"),
+        intents=intents,
+    )
+    await changed.collect_counts_for_period(channel, start_date, end_date)
+    after, _ = channel.history_calls[-1]
+    assert isinstance(after, datetime), "state survived a config change"
+    print("State from a different configuration is discarded: OK")
+    print()
+
+
+def check_update_matching(config) -> None:
+    print("=== UPDATE MATCHING CHECKS ===")
+    samples = [
+        "update",
+        "Daily Update posted",
+        "DAILY UPDATES",
+        "my update.",
+        "(update)",
+        "update_1",
+        "_update",
+        "updated",
+        "preupdate",
+        "daily-update",
+        "daily  update",
+        "dailyupdate",
+        "update\u0301",
+        "\u0130update",
+        "caf\u00e9 update",
+        "\u00e9update",
+        "update\u00e9",
+        "",
+    ]
+    for pattern in (r"\b(update|daily update)\b", r"\b(?:updates|eod)\b", r"\b(daily-update|x)\b"):
+        bot = DiscordAutomationBot(
+            config=replace(config, update_message_pattern=pattern),
+            intents=discord.Intents.none(),
+        )
+        assert bot.update_message_literals is not None, f"{pattern!r} did not take the literal fast path"
+        for content in samples:
+            expected = bool(bot.update_message_regex.search(content))
+            assert bot.is_update_message(content) == expected, f"{pattern!r} disagrees with re on {content!r}"
+    print("Literal fast path agrees with the regex: OK")
+
+
+async def check_manual_commands(config) -> None:
+    print()
+    print("=== MANUAL COMMAND CHECKS ===")
+    intents = discord.Intents.none()
+    bot = DiscordAutomationBot(config=config, intents=intents)
+    weekly = config.weekly_report_command.strip().lower()
+    monthly = config.monthly_report_command.strip().lower()
+    for content, expected in (
+        (f"  {weekly.upper()}  ", weekly),
+        (f"\t{monthly.title()}", monthly),
+        (f"{weekly} please", None),
+        ("daily update", None),
+        ("", None),
+    ):
+        normalized = bot.normalize_command(content)
+        assert normalized == expected, f"{content!r} normalized to {normalized!r}"
+
+    # Non-ASCII first characters can lowercase into a configured command.
+    unicode_bot = DiscordAutomationBot(
+        config=replace(config, monthly_report_command="\u0130x", manual_reminder_command="kpi"),
+        intents=intents,
+    )
+    assert unicode_bot.normalize_command("\u0130X") == "\u0130x".lower(), "dotted capital I command was rejected"
+    assert unicode_bot.normalize_command("\u212aPI") == "kpi", "Kelvin sign command was rejected"
+    print("Command normalization matches strip().lower(): OK")
+
+    # Commands that collide after normalization resolve weekly > monthly > reminder.
+    fake_channel = FakeChannel([])
+
+    async def fake_get_target_channel():
+        return fake_channel
+
+    for weekly_cmd, monthly_cmd, reminder_cmd, expected_title in (
+        ("!go", "!GO ", "!Go", WEEKLY_REPORT_TITLE),
+        ("!weekly", "!go", "!GO", MONTHLY_REPORT_TITLE),
+    ):
+        with tempfile.TemporaryDirectory() as state_dir:
+            colliding = DiscordAutomationBot(
+                config=replace(
+                    config,
+                    weekly_report_command=weekly_cmd,
+                    monthly_report_command=monthly_cmd,
+                    manual_reminder_command=reminder_cmd,
+                    state_path=Path(state_dir) / "state.json",
+                ),
+                intents=intents,
+            )
+            colliding.get_target_channel = fake_get_target_channel  # type: ignore[method-assign]
+            fake_channel.sent_messages.clear()
+            message = SimpleNamespace(
+                author=FakeAuthor(config.user_ids[0]),
+                channel=SimpleNamespace(id=config.channel_id),
+                content=" !gO ",
+            )
+            await colliding.on_message(message)
+        assert len(fake_channel.sent_messages) == 1, f"expected one reply, got {len(fake_channel.sent_messages)}"
+        assert fake_channel.sent_messages[0][1].startswith(expected_title), "colliding command ran the wrong handler"
+    print("Colliding commands dispatch weekly > monthly > reminder: OK")
+
+
+async def run() -> None:
+    # Make emoji/table output safe in Windows terminals using cp1252.
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+    except Exception:
+        pass
+
+    load_environment()
+    # Start from an empty tally so every run backfills from the synthetic history.
+    with tempfile.TemporaryDirectory() as state_dir:
+        config = replace(load_config(), state_path=Path(state_dir) / "state.json")
+        await run_reports(config)
+    check_update_matching(config)
+    await check_manual_commands(config)
 
 
 if __name__ == "__main__":